@@ -31,6 +31,7 @@ from shutil import which
 
 from pyworkflow.gui import FileTreeProvider
 from pyworkflow.gui.project.utils import OS
+from pyworkflow.protocol import STEPS_PARALLEL
 import pwem
 
 from .constants import IMOD_HOME, ETOMO_CMD, DEFAULT_VERSION, VERSIONS
@@ -148,11 +149,22 @@ class Plugin(pwem.Plugin):
                            commands=[(installationCmd, IMOD_INSTALLED)],
                            default=default)
 
+    @classmethod
+    def _getImodProcessors(cls, protocol):
+        """ Number of processors each IMOD command can use. When the
+        protocol runs its steps in parallel, its threads are already used
+        to run several commands at once, so each one gets a single
+        processor. """
+        if protocol.stepsExecutionMode == STEPS_PARALLEL:
+            return 1
+
+        return protocol.numberOfThreads.get()
+
     @classmethod
     def runImod(cls, protocol, program, args, cwd=None):
         """ Run IMOD command from a given protocol. """
 
-        ncpus = protocol.numberOfThreads.get()
+        ncpus = cls._getImodProcessors(protocol)
 
         # Get the command
         cmd = cls.getImodCmd(program, ncpus)
@@ -161,6 +173,25 @@ class Plugin(pwem.Plugin):
         protocol.runJob(cmd, args, env=cls.getEnviron(), cwd=cwd,
                         numberOfMpi=1, numberOfThreads=1)
 
+    @classmethod
+    def runImodPipeline(cls, protocol, programs, cwd=None):
+        """ Run several IMOD commands from a given protocol in a single
+        job. Each command only runs if the previous one succeeded.
+        :param programs: list of (program, args) tuples, in running order. """
+
+        ncpus = cls._getImodProcessors(protocol)
+
+        (program, args), *nextPrograms = programs
+
+        # The first command sets the environment used by the rest
+        cmd = cls.getImodCmd(program, ncpus)
+
+        for nextProgram, nextArgs in nextPrograms:
+            args += " && %s %s" % (cls._getProgram(nextProgram), nextArgs)
+
+        protocol.runJob(cmd, args, env=cls.getEnviron(), cwd=cwd,
+                        numberOfMpi=1, numberOfThreads=1)
+
     @classmethod
     def getImodCmd(cls, program, ncpus=1):
         """ Composes an IMOD command for a given program. """
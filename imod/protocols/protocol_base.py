@@ -25,6 +25,7 @@
 # *****************************************************************************
 
 import os
+from functools import partial
 
 from pyworkflow.object import Set, CsvList, Pointer
 from pyworkflow.protocol import STEPS_PARALLEL
@@ -98,6 +99,25 @@ class ProtImodBase(ProtTomoImportFiles, EMProtocol, ProtTomoBase):
         elif isinstance(self.inputSetOfTiltSeries, Pointer):
             ts = self.inputSetOfTiltSeries.get()[tsObjId]
 
+        convertJob = self.getConvertInputJob(ts, imodInterpolation=imodInterpolation,
+                                             doSwap=doSwap)
+        convertJob()
+
+        if generateAngleFile:
+            self.generateAngleFile(ts)
+
+    def getConvertInputJob(self, ts, imodInterpolation=True, doSwap=False):
+        """ Reads from the tilt series everything needed to make its stack
+        available in the tmp folder and returns a function doing the
+        remaining work (linking the stack or running newstack). The
+        returned function does not access the tilt series, so it can be
+        run from a different thread.
+
+        :param ts: Tilt series to convert
+        :param imodInterpolation: see convertInputStep
+        :param doSwap: see convertInputStep
+        :return: function without arguments running the conversion
+        """
         tsId = ts.getTsId()
 
         extraPrefix = self._getExtraPath(tsId)
@@ -108,12 +128,17 @@ class ProtImodBase(ProtTomoImportFiles, EMProtocol, ProtTomoBase):
 
         firstItem = ts.getFirstItem()
 
+        inputTsFileName = firstItem.getFileName()
         outputTsFileName = os.path.join(tmpPrefix, firstItem.parseFileName())
 
+        def linkStack(message):
+            self.info(message)
+            path.createLink(inputTsFileName, outputTsFileName)
+            self.info("Tilt series %s available for processing at %s." % (tsId, outputTsFileName))
+
         # .. Interpolation cancelled
         if imodInterpolation is None:
-            self.info("Tilt series %s linked." % tsId)
-            path.createLink(firstItem.getFileName(), outputTsFileName)
+            return partial(linkStack, "Tilt series %s linked." % tsId)
 
         elif imodInterpolation:
             """Apply the transformation form the input tilt-series"""
@@ -124,31 +149,51 @@ class ProtImodBase(ProtTomoImportFiles, EMProtocol, ProtTomoBase):
                                                 firstItem.parseFileName(extension=".xf"))
                 utils.formatTransformFile(ts, outputTmFileName)
 
-                argsAlignment, paramsAlignment = self.getBasicNewstackParams(ts,
-                                                                             outputTsFileName,
-                                                                             xfFile=outputTmFileName,
-                                                                             firstItem=firstItem,
-                                                                             doSwap=doSwap)
+                if self._isInterpolationNeeded(ts, doSwap):
+                    argsAlignment, paramsAlignment = self.getBasicNewstackParams(ts,
+                                                                                 outputTsFileName,
+                                                                                 xfFile=outputTmFileName,
+                                                                                 firstItem=firstItem,
+                                                                                 doSwap=doSwap)
 
-                self.info("Interpolating tilt series %s with imod" % tsId)
-                Plugin.runImod(self, 'newstack', argsAlignment % paramsAlignment)
+                    def interpolateStack():
+                        self.info("Interpolating tilt series %s with imod" % tsId)
+                        Plugin.runImod(self, 'newstack', argsAlignment % paramsAlignment)
+                        self.info("Tilt series %s available for processing at %s." % (tsId, outputTsFileName))
 
-            else:
-                self.info("Linking tilt series %s" % tsId)
-                path.createLink(firstItem.getFileName(), outputTsFileName)
+                    return interpolateStack
+
+                # Newstack would only copy the stack
+                return partial(linkStack, "Linking tilt series %s with identity transforms" % tsId)
+
+            return partial(linkStack, "Linking tilt series %s" % tsId)
 
         # Use Xmipp interpolation via Scipion
-        else:
+        elif self._isInterpolationNeeded(ts):
+            # It reads the images through the tilt series, do it right now
             self.info("Interpolating tilt series %s with emlib" % tsId)
             ts.applyTransform(outputTsFileName)
+            self.info("Tilt series %s available for processing at %s." % (tsId, outputTsFileName))
 
-        self.info("Tilt series %s available for processing at %s." % (tsId, outputTsFileName))
+            return lambda: None
 
-        if generateAngleFile:
-            """Generate angle file"""
-            angleFilePath = os.path.join(tmpPrefix,
-                                         firstItem.parseFileName(extension=".tlt"))
-            ts.generateTltFile(angleFilePath)
+        return partial(linkStack, "Linking tilt series %s with identity transforms" % tsId)
+
+    def generateAngleFile(self, ts):
+        """ Generate the IMOD angle file of the tilt series in the tmp folder """
+        angleFilePath = os.path.join(self._getTmpPath(ts.getTsId()),
+                                     ts.getFirstItem().parseFileName(extension=".tlt"))
+        ts.generateTltFile(angleFilePath)
+
+    @staticmethod
+    def _isInterpolationNeeded(ts, doSwap=False):
+        """ Returns False if interpolating the tilt series would produce a
+        plain copy of the input stack: all the transforms are identities
+        and the image size is not swapped. """
+        if doSwap and 45 < abs(ts.getAcquisition().getTiltAxisAngle()) < 135:
+            return True
+
+        return not utils.hasIdentityTransforms(ts)
 
     def getBasicNewstackParams(self, ts, outputTsFileName, inputTsFileName=None,
                                xfFile=None, firstItem=None, binning=1, doSwap=False):
@@ -247,7 +292,7 @@ class ProtImodBase(ProtTomoImportFiles, EMProtocol, ProtTomoBase):
                 outputInterpolatedSetOfTiltSeries.setSamplingRate(inputSet.getSamplingRate())
                 outputInterpolatedSetOfTiltSeries.setDim(inputSet.getDim())
 
-            if self.binning > 1:
+            if self.binning.get() > 1:
                 samplingRate = inputSet.getSamplingRate()
                 samplingRate *= self.binning.get()
                 outputInterpolatedSetOfTiltSeries.setSamplingRate(samplingRate)
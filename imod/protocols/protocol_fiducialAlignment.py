@@ -503,7 +503,7 @@ class ProtImodFiducialAlignment(ProtImodBase):
                 if tiltImage.hasTransform():
                     transform = Transform()
                     previousTransform = tiltImage.getTransform().getMatrix()
-                    newTransform = newTransformationMatricesList[:, :, index]
+                    newTransform = newTransformationMatricesList[index]
                     previousTransformArray = np.array(previousTransform)
                     newTransformArray = np.array(newTransform)
                     outputTransformMatrix = np.matmul(newTransformArray, previousTransformArray)
@@ -511,7 +511,7 @@ class ProtImodFiducialAlignment(ProtImodBase):
                     newTi.setTransform(transform)
                 else:
                     transform = Transform()
-                    newTransform = newTransformationMatricesList[:, :, index]
+                    newTransform = newTransformationMatricesList[index]
                     newTransformArray = np.array(newTransform)
                     transform.setMatrix(newTransformArray)
                     newTi.setTransform(transform)
@@ -127,7 +127,7 @@ class ProtImodImportTransformationMatrix(ProtImodBase):
 
                     ids = ts.getIdSet()
                     for index in ids:
-                        inputTransformMatrix = inputTransformMatrixList[:, :, index-1]
+                        inputTransformMatrix = inputTransformMatrixList[index-1]
 
                         outputTransformMatrix = inputTransformMatrix
                         outputTransformMatrix[0][0] = inputTransformMatrix[0][0]
@@ -175,7 +175,7 @@ class ProtImodImportTransformationMatrix(ProtImodBase):
 
             if tiltImage.hasTransform():
                 previousTransform = tiltImage.getTransform().getMatrix()
-                newTransform = alignmentMatrix[:, :, index]
+                newTransform = alignmentMatrix[index]
                 previousTransformArray = np.array(previousTransform)
                 newTransformArray = np.array(newTransform)
                 outputTransformMatrix = np.matmul(previousTransformArray, newTransformArray)
@@ -183,7 +183,7 @@ class ProtImodImportTransformationMatrix(ProtImodBase):
                 newTi.setTransform(transform)
 
             else:
-                transform.setMatrix(alignmentMatrix[:, :, index])
+                transform.setMatrix(alignmentMatrix[index])
                 newTi.setTransform(transform)
 
             newTs.append(newTi)
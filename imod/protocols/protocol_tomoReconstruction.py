@@ -25,9 +25,13 @@
 # *****************************************************************************
 
 import os
+import threading
+from functools import cached_property
 
 from pyworkflow import BETA
 from pyworkflow.object import Set
+from pyworkflow.protocol import STEPS_PARALLEL
+import pyworkflow.utils as pwutils
 import pyworkflow.protocol.params as params
 from tomo.objects import Tomogram
 
@@ -46,6 +50,16 @@ class ProtImodTomoReconstruction(ProtImodBase):
     _label = 'Tomo reconstruction'
     _devStatus = BETA
 
+    def __init__(self, **args):
+        ProtImodBase.__init__(self, **args)
+
+        # The steps executor is chosen before inserting the steps
+        self.stepsExecutionMode = STEPS_PARALLEL
+
+        # Limit the number of tilt jobs sharing each GPU
+        self._gpuSemaphores = {}
+        self._gpuSemaphoresLock = threading.Lock()
+
     # -------------------------- DEFINE param functions -----------------------
     def _defineParams(self, form):
         form.addSection('Input')
@@ -161,71 +175,103 @@ class ProtImodTomoReconstruction(ProtImodBase):
                             "For a specific GPU set its number ID "
                             "(starting from 1).")
 
+        form.addParam('tiltsPerGpu',
+                      params.IntParam,
+                      default=1,
+                      validators=[params.Positive],
+                      expertLevel=params.LEVEL_ADVANCED,
+                      label='Reconstructions per GPU',
+                      help='Maximum number of tilt-series reconstructed '
+                           'at the same time on each GPU. The total number '
+                           'of concurrent reconstructions is limited by the '
+                           'number of threads.')
+
+        form.addParallelSection(threads=1, mpi=0)
+
     # -------------------------- INSERT steps functions -----------------------
     def _insertAllSteps(self):
-        for ts in self.inputSetOfTiltSeries.get():
-            self._insertFunctionStep(self.convertInputStep, ts.getObjId())
-            self._insertFunctionStep(self.computeReconstructionStep, ts.getObjId())
-            self._insertFunctionStep(self.createOutputStep, ts.getObjId())
-        self._insertFunctionStep(self.closeOutputSetsStep)
+        gpuList = self.getGpuList() or [0]
+        allOutputId = []
 
-    # --------------------------- STEPS functions -----------------------------
-    def convertInputStep(self, tsObjId):
-        # Considering swapXY is required to make tilt axis vertical
-        super().convertInputStep(tsObjId, doSwap=True)
-
-    def computeReconstructionStep(self, tsObjId):
-        ts = self.inputSetOfTiltSeries.get()[tsObjId]
-        tsId = ts.getTsId()
-
-        firstItem = ts.getFirstItem()
-
-        extraPrefix = self._getExtraPath(tsId)
-        tmpPrefix = self._getTmpPath(tsId)
-
-        paramsTilt = {
-            'InputProjections': os.path.join(tmpPrefix, firstItem.parseFileName()),
-            'OutputFile': os.path.join(tmpPrefix, firstItem.parseFileName(extension=".rec")),
-            'TiltFile': os.path.join(tmpPrefix, firstItem.parseFileName(extension=".tlt")),
-            'Thickness': self.tomoThickness.get(),
-            'FalloffIsTrueSigma': 1,
-            'Radial': str(self.radialFirstParameter.get()) + "," + str(self.radialSecondParameter.get()),
-            'Shift': str(self.tomoShiftX.get()) + "," + str(self.tomoShiftZ.get()),
-            'Offset': str(self.angleOffset.get()) + "," + str(self.tiltAxisOffset.get()),
-        }
+        for index, ts in enumerate(self.inputSetOfTiltSeries.get()):
+            gpuId = gpuList[index % len(gpuList)]
 
-        argsTilt = "-InputProjections %(InputProjections)s " \
-                   "-OutputFile %(OutputFile)s " \
-                   "-TILTFILE %(TiltFile)s " \
-                   "-THICKNESS %(Thickness)d " \
-                   "-FalloffIsTrueSigma %(FalloffIsTrueSigma)d " \
-                   "-RADIAL %(Radial)s " \
-                   "-SHIFT %(Shift)s " \
-                   "-OFFSET %(Offset)s " \
-                   "-MODE 1 " \
-                   "-PERPENDICULAR " \
-                   "-AdjustOrigin "
+            convertId = self._insertFunctionStep(self.convertInputStep,
+                                                 ts.getObjId(),
+                                                 prerequisites=[])
 
-        if self.fakeInteractionsSIRT.get() != 0:
-            paramsTilt.update({
-                'FakeSIRTInteractions': self.fakeInteractionsSIRT.get()
-            })
-            argsTilt += "-FakeSIRTiterations %(FakeSIRTInteractions)d "
+            reconstructId = self._insertFunctionStep(self.computeReconstructionStep,
+                                                     ts.getObjId(),
+                                                     gpuId,
+                                                     prerequisites=[convertId])
+
+            outputId = self._insertFunctionStep(self.createOutputStep,
+                                                ts.getObjId(),
+                                                prerequisites=[reconstructId])
 
-        # Excluded views
-        excludedViews = ts.getExcludedViewsIndex(caster=str)
-        if len(excludedViews):
-            argsTilt += f"-EXCLUDELIST2 {','.join(excludedViews)} "
+            allOutputId.append(outputId)
+
+        self._insertFunctionStep(self.closeOutputSetsStep,
+                                 prerequisites=allOutputId)
+
+    # --------------------------- STEPS functions -----------------------------
+    def convertInputStep(self, tsObjId):
+        # Steps run in parallel: read the tilt series holding the lock and
+        # only run the conversion (link or newstack) outside of it
+        with self._lock:
+            ts = self.inputSetOfTiltSeries.get()[tsObjId]
+            # Considering swapXY is required to make tilt axis vertical
+            convertJob = self.getConvertInputJob(ts, doSwap=True)
+            self.generateAngleFile(ts)
+
+        convertJob()
+
+    def computeReconstructionStep(self, tsObjId, gpuId=0):
+        # Read the tilt series and build the arguments holding the lock,
+        # tilt and trimvol run outside of it
+        with self._lock:
+            ts = self.inputSetOfTiltSeries.get()[tsObjId]
+            tsId = ts.getTsId()
+
+            firstItem = ts.getFirstItem()
+
+            extraPrefix = self._getExtraPath(tsId)
+            tmpPrefix = self._getTmpPath(tsId)
+
+            tomoFileName = os.path.join(extraPrefix, firstItem.parseFileName(extension=".mrc"))
+            recFileName = os.path.join(tmpPrefix, firstItem.parseFileName(extension=".rec"))
+            tmpTomoFileName = os.path.join(extraPrefix, firstItem.parseFileName(suffix="_tmp",
+                                                                                extension=".mrc"))
+
+            argsTilt = f"-InputProjections {os.path.join(tmpPrefix, firstItem.parseFileName())} " \
+                       f"-OutputFile {recFileName} " \
+                       f"-TILTFILE {os.path.join(tmpPrefix, firstItem.parseFileName(extension='.tlt'))} "
+            argsTilt += self._tiltArgs
+
+            # Excluded views
+            excludedViews = ts.getExcludedViewsIndex(caster=str)
+            if len(excludedViews):
+                argsTilt += f"-EXCLUDELIST2 {','.join(excludedViews)} "
+
+        # Skip tilt-series already reconstructed in a previous execution
+        if os.path.exists(tomoFileName) and os.stat(tomoFileName).st_size != 0:
+            self.info("Tomogram %s already reconstructed." % tsId)
+            return
 
         if self.usesGpu():
-            argsTilt += f"-UseGPU {self.getGpuList()[0]} " \
+            argsTilt += f"-UseGPU {gpuId} " \
                         "-ActionIfGPUFails 2,2 "
 
-        Plugin.runImod(self, 'tilt', argsTilt % paramsTilt)
+            with self._getGpuSemaphore(gpuId):
+                Plugin.runImod(self, 'tilt', argsTilt)
+        else:
+            Plugin.runImod(self, 'tilt', argsTilt)
 
+        # Write to a temporary name so an interrupted trimvol never leaves
+        # a partial tomogram that would be taken as finished
         paramsTrimVol = {
-            'input': os.path.join(tmpPrefix, firstItem.parseFileName(extension=".rec")),
-            'output': os.path.join(extraPrefix, firstItem.parseFileName(extension=".mrc")),
+            'input': recFileName,
+            'output': tmpTomoFileName,
             'options': "-rx "
         }
 
@@ -234,35 +280,72 @@ class ProtImodTomoReconstruction(ProtImodBase):
                       "%(output)s "
 
         Plugin.runImod(self, 'trimvol', argsTrimvol % paramsTrimVol)
+        os.replace(paramsTrimVol['output'], tomoFileName)
+
+        # The raw reconstruction is as big as the final tomogram, do not keep
+        # it in the tmp folder until the end of the protocol
+        if not pwutils.envVarOn('SCIPION_DEBUG_NOCLEAN'):
+            pwutils.cleanPath(paramsTrimVol['input'])
 
     def createOutputStep(self, tsObjId):
-        ts = self.inputSetOfTiltSeries.get()[tsObjId]
-        tsId = ts.getTsId()
-        firstItem = ts.getFirstItem()
-
-        extraPrefix = self._getExtraPath(tsId)
-
-        output = self.getOutputSetOfTomograms(self.inputSetOfTiltSeries.get())
-
-        newTomogram = Tomogram()
-        newTomogram.setLocation(os.path.join(extraPrefix,
-                                             firstItem.parseFileName(extension=".mrc")))
-        newTomogram.setTsId(tsId)
-        newTomogram.setSamplingRate(ts.getSamplingRate())
-        # Set default tomogram origin
-        newTomogram.setOrigin(newOrigin=None)
-        newTomogram.setAcquisition(ts.getAcquisition())
-
-        output.append(newTomogram)
-        output.update(newTomogram)
-        output.write()
-        self._store()
+        tsSet = self.inputSetOfTiltSeries.get()
+
+        # Steps run in parallel: only one of them can create or update the output
+        with self._lock:
+            ts = tsSet[tsObjId]
+            tsId = ts.getTsId()
+            firstItem = ts.getFirstItem()
+
+            extraPrefix = self._getExtraPath(tsId)
+
+            output = self.getOutputSetOfTomograms(tsSet)
+
+            newTomogram = Tomogram()
+            newTomogram.setLocation(os.path.join(extraPrefix,
+                                                 firstItem.parseFileName(extension=".mrc")))
+            newTomogram.setTsId(tsId)
+            newTomogram.setSamplingRate(ts.getSamplingRate())
+            # Set default tomogram origin
+            newTomogram.setOrigin(newOrigin=None)
+            newTomogram.setAcquisition(ts.getAcquisition())
+
+            output.append(newTomogram)
+            output.write()
 
     def closeOutputSetsStep(self):
         self.Tomograms.setStreamState(Set.STREAM_CLOSED)
         self.Tomograms.write()
         self._store()
 
+    # --------------------------- UTILS functions ----------------------------
+    @cached_property
+    def _tiltArgs(self):
+        """ Arguments of tilt that only depend on the form parameters,
+        so they are the same for every tilt-series. """
+        args = f"-THICKNESS {int(self.tomoThickness.get())} " \
+               "-FalloffIsTrueSigma 1 " \
+               f"-RADIAL {self.radialFirstParameter.get()},{self.radialSecondParameter.get()} " \
+               f"-SHIFT {self.tomoShiftX.get()},{self.tomoShiftZ.get()} " \
+               f"-OFFSET {self.angleOffset.get()},{self.tiltAxisOffset.get()} " \
+               "-MODE 1 " \
+               "-PERPENDICULAR " \
+               "-AdjustOrigin "
+
+        if self.fakeInteractionsSIRT.get() != 0:
+            args += f"-FakeSIRTiterations {self.fakeInteractionsSIRT.get()} "
+
+        return args
+
+    def _getGpuSemaphore(self, gpuId):
+        """ Returns the semaphore bounding the concurrent tilt jobs
+        running on the given GPU. """
+        with self._gpuSemaphoresLock:
+            if gpuId not in self._gpuSemaphores:
+                self._gpuSemaphores[gpuId] = \
+                    threading.BoundedSemaphore(self.tiltsPerGpu.get())
+
+            return self._gpuSemaphores[gpuId]
+
     # --------------------------- INFO functions ----------------------------
     def _summary(self):
         summary = []
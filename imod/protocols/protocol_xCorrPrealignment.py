@@ -25,6 +25,7 @@
 # *****************************************************************************
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 from pyworkflow import BETA
@@ -139,17 +140,71 @@ class ProtImodXcorrPrealignment(ProtImodBase):
 
     # -------------------------- INSERT steps functions -----------------------
     def _insertAllSteps(self):
-        for ts in self.inputSetOfTiltSeries.get():
-            self._insertFunctionStep(self.convertInputStep, ts.getObjId())
-            self._insertFunctionStep(self.computeXcorrStep, ts.getObjId())
-            self._insertFunctionStep(self.generateOutputStackStep,
-                                     ts.getObjId())
-            if self.computeAlignment.get() == 0:
+        computeInterpolated = self.computeAlignment.get() == 0
+        tsObjIds = [ts.getObjId() for ts in self.inputSetOfTiltSeries.get()]
+
+        self._insertFunctionStep(self.convertAllInputsStep)
+        for tsObjId in tsObjIds:
+            self._insertFunctionStep(self.computeXcorrStep, tsObjId)
+            self._insertFunctionStep(self.generateOutputStackStep, tsObjId)
+            if computeInterpolated:
                 self._insertFunctionStep(self.computeInterpolatedStackStep,
-                                         ts.getObjId())
+                                         tsObjId)
         self._insertFunctionStep(self.closeOutputSetsStep)
 
     # --------------------------- STEPS functions -----------------------------
+    def convertAllInputsStep(self):
+        """ Convert all the input tilt-series concurrently. The tilt-series
+        are read here, in the step thread, and only the external work
+        (links and newstack runs) goes to the thread pool: it is I/O bound
+        and does not hold the GIL. This is a single step, if any conversion
+        fails continuing the protocol runs it again but skips the
+        tilt-series already converted. """
+        tsSet = self.inputSetOfTiltSeries.get()
+        tsObjIds = [ts.getObjId() for ts in tsSet]
+
+        tsToConvert = []
+        convertJobs = []
+
+        for tsObjId in tsObjIds:
+            ts = tsSet[tsObjId]
+            tmpPrefix = self._getTmpPath(ts.getTsId())
+            angleFilePath = os.path.join(tmpPrefix,
+                                         ts.getFirstItem().parseFileName(extension=".tlt"))
+
+            # Skip tilt-series already converted in a previous execution,
+            # the angle file is written once the stack is available
+            if os.path.exists(angleFilePath):
+                self.info("Tilt series %s already converted." % ts.getTsId())
+                continue
+
+            tsToConvert.append(ts)
+            convertJobs.append(self.getConvertInputJob(ts))
+
+        if not convertJobs:
+            return
+
+        failedTsIds = []
+
+        with ThreadPoolExecutor(max_workers=min(8, len(convertJobs))) as executor:
+            futures = [executor.submit(job) for job in convertJobs]
+
+            # Mark each tilt-series as converted as soon as its own job
+            # succeeds, so a new execution only converts the failed ones
+            for ts, future in zip(tsToConvert, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.error("Tilt series %s could not be converted: %s"
+                               % (ts.getTsId(), e))
+                    failedTsIds.append(ts.getTsId())
+                else:
+                    self.generateAngleFile(ts)
+
+        if failedTsIds:
+            raise Exception("Error (convertAllInputsStep): \n the conversion "
+                            "of tilt-series %s failed." % ", ".join(failedTsIds))
+
     def computeXcorrStep(self, tsObjId):
         """Compute transformation matrix for each tilt series"""
         ts = self.inputSetOfTiltSeries.get()[tsObjId]
@@ -157,6 +212,13 @@ class ProtImodXcorrPrealignment(ProtImodBase):
         extraPrefix = self._getExtraPath(tsId)
         tmpPrefix = self._getTmpPath(tsId)
 
+        # Skip tilt-series already aligned in a previous execution
+        prexgFileName = os.path.join(extraPrefix,
+                                     ts.getFirstItem().parseFileName(extension=".prexg"))
+        if os.path.exists(prexgFileName) and os.stat(prexgFileName).st_size != 0:
+            self.info("Tilt series %s already aligned." % tsId)
+            return
+
         paramsXcorr = {
             'input': os.path.join(tmpPrefix,
                                   ts.getFirstItem().parseFileName()),
@@ -188,8 +250,6 @@ class ProtImodXcorrPrealignment(ProtImodBase):
         if len(excludedViews):
             argsXcorr += f"-SkipViews {','.join(excludedViews)} "
 
-        Plugin.runImod(self, 'tiltxcorr', argsXcorr % paramsXcorr)
-
         paramsXftoxg = {
             'input': os.path.join(extraPrefix,
                                   ts.getFirstItem().parseFileName(extension=".prexf")),
@@ -199,46 +259,49 @@ class ProtImodXcorrPrealignment(ProtImodBase):
         argsXftoxg = "-input %(input)s " \
                      "-NumberToFit 0 " \
                      "-goutput %(goutput)s "
-        Plugin.runImod(self, 'xftoxg', argsXftoxg % paramsXftoxg)
+
+        Plugin.runImodPipeline(self, [('tiltxcorr', argsXcorr % paramsXcorr),
+                                      ('xftoxg', argsXftoxg % paramsXftoxg)])
 
     def generateOutputStackStep(self, tsObjId):
         """ Generate tilt-serie with the associated transform matrix """
-        ts = self.inputSetOfTiltSeries.get()[tsObjId]
+        tsSet = self.inputSetOfTiltSeries.get()
+        ts = tsSet[tsObjId]
         tsId = ts.getTsId()
 
         extraPrefix = self._getExtraPath(tsId)
 
-        output = self.getOutputSetOfTiltSeries(self.inputSetOfTiltSeries.get())
+        output = self.getOutputSetOfTiltSeries(tsSet)
+
+        prexgFileName = os.path.join(extraPrefix,
+                                     ts.getFirstItem().parseFileName(extension=".prexg"))
+        alignmentMatrix = utils.formatTransformationMatrix(prexgFileName)
 
-        alignmentMatrix = utils.formatTransformationMatrix(
-            os.path.join(extraPrefix,
-                         ts.getFirstItem().parseFileName(extension=".prexg")))
+        if len(alignmentMatrix) != ts.getSize():
+            raise Exception("Error (generateOutputStackStep): \n Imod output file "
+                            "%s contains %d transformation matrices but "
+                            "tilt-series %s has %d tilt-images."
+                            % (prexgFileName, len(alignmentMatrix), tsId, ts.getSize()))
 
         newTs = tomoObj.TiltSeries(tsId=tsId)
         newTs.copyInfo(ts)
 
         output.append(newTs)
 
-        for index, tiltImage in enumerate(ts):
+        for tiltImage, newTransform in zip(ts, alignmentMatrix):
             newTi = tomoObj.TiltImage()
             newTi.copyInfo(tiltImage, copyId=True, copyTM=False)
 
+            transform = Transform()
+
             if tiltImage.hasTransform():
-                transform = Transform()
                 previousTransform = tiltImage.getTransform().getMatrix()
-                newTransform = alignmentMatrix[:, :, index]
-                previousTransformArray = np.array(previousTransform)
-                newTransformArray = np.array(newTransform)
-                outputTransformMatrix = np.matmul(newTransformArray, previousTransformArray)
-                transform.setMatrix(outputTransformMatrix)
-                newTi.setTransform(transform)
+                transform.setMatrix(np.matmul(newTransform, previousTransform))
 
             else:
-                transform = Transform()
-                newTransform = alignmentMatrix[:, :, index]
-                newTransformArray = np.array(newTransform)
-                transform.setMatrix(newTransformArray)
-                newTi.setTransform(transform)
+                transform.setMatrix(newTransform.copy())
+
+            newTi.setTransform(transform)
 
             newTi.setAcquisition(tiltImage.getAcquisition())
             newTi.setLocation(tiltImage.getLocation())
@@ -250,13 +313,13 @@ class ProtImodXcorrPrealignment(ProtImodBase):
         output.update(newTs)
         output.write()
 
-        self._store()
-
     def computeInterpolatedStackStep(self, tsObjId):
-        output = self.getOutputInterpolatedSetOfTiltSeries(self.inputSetOfTiltSeries.get())
+        tsSet = self.inputSetOfTiltSeries.get()
+        output = self.getOutputInterpolatedSetOfTiltSeries(tsSet)
 
-        ts = self.inputSetOfTiltSeries.get()[tsObjId]
+        ts = tsSet[tsObjId]
         tsId = ts.getTsId()
+        binning = int(self.binning.get())
 
         extraPrefix = self._getExtraPath(tsId)
         tmpPrefix = self._getTmpPath(tsId)
@@ -266,7 +329,7 @@ class ProtImodXcorrPrealignment(ProtImodBase):
             'output': os.path.join(extraPrefix, ts.getFirstItem().parseFileName()),
             'xform': os.path.join(extraPrefix,
                                   ts.getFirstItem().parseFileName(extension=".prexg")),
-            'bin': int(self.binning.get()),
+            'bin': binning,
             'imagebinned': 1.0
         }
         argsAlignment = "-input %(input)s " \
@@ -284,8 +347,8 @@ class ProtImodXcorrPrealignment(ProtImodBase):
         newTs.setInterpolated(True)
         output.append(newTs)
 
-        if self.binning > 1:
-            newTs.setSamplingRate(ts.getSamplingRate() * int(self.binning.get()))
+        if binning > 1:
+            newTs.setSamplingRate(ts.getSamplingRate() * binning)
 
         for index, tiltImage in enumerate(ts):
             newTi = tomoObj.TiltImage()
@@ -293,8 +356,8 @@ class ProtImodXcorrPrealignment(ProtImodBase):
             newTi.setLocation(index + 1,
                               (os.path.join(extraPrefix,
                                             tiltImage.parseFileName())))
-            if self.binning > 1:
-                newTi.setSamplingRate(tiltImage.getSamplingRate() * int(self.binning.get()))
+            if binning > 1:
+                newTi.setSamplingRate(tiltImage.getSamplingRate() * binning)
             newTs.append(newTi)
 
         ih = ImageHandler()
@@ -305,7 +368,6 @@ class ProtImodXcorrPrealignment(ProtImodBase):
 
         output.update(newTs)
         output.write()
-        self._store()
 
     def closeOutputSetsStep(self):
         self.TiltSeries.setStreamState(Set.STREAM_CLOSED)
@@ -317,6 +379,16 @@ class ProtImodXcorrPrealignment(ProtImodBase):
         self._store()
 
     # --------------------------- INFO functions ------------------------------
+    def _validate(self):
+        validateMsgs = []
+
+        if self.computeAlignment.get() == 0 and \
+                not float(self.binning.get()).is_integer():
+            validateMsgs.append("Binning of the interpolated tilt-series "
+                                "must be an integer.")
+
+        return validateMsgs
+
     def _summary(self):
         summary = []
         if self.TiltSeries:
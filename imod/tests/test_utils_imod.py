@@ -0,0 +1,106 @@
+# *****************************************************************************
+# *
+# * Authors:     Federico P. de Isidro Gomez (fp.deisidro@cnb.csic.es) [1]
+# *
+# * [1] Centro Nacional de Biotecnologia, CSIC, Spain
+# *
+# * This program is free software; you can redistribute it and/or modify
+# * it under the terms of the GNU General Public License as published by
+# * the Free Software Foundation; either version 3 of the License, or
+# * (at your option) any later version.
+# *
+# * This program is distributed in the hope that it will be useful,
+# * but WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# * GNU General Public License for more details.
+# *
+# * You should have received a copy of the GNU General Public License
+# * along with this program; if not, write to the Free Software
+# * Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA
+# * 02111-1307  USA
+# *
+# *  All comments concerning this program package may be sent to the
+# *  e-mail address 'scipion@cnb.csic.es'
+# *
+# *****************************************************************************
+
+import numpy as np
+
+from pyworkflow.tests import BaseTest, setupTestOutput
+from pwem.objects import Transform
+from tomo.objects import TiltImage
+
+from .. import utils
+
+
+class TestImodUtils(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        setupTestOutput(cls)
+
+    @classmethod
+    def _writeFile(cls, fileName, lines):
+        filePath = cls.getOutputPath(fileName)
+
+        with open(filePath, 'w') as f:
+            f.writelines(lines)
+
+        return filePath
+
+    @staticmethod
+    def _tiltImage(matrix):
+        transform = Transform()
+        transform.setMatrix(matrix)
+
+        ti = TiltImage()
+        ti.setTransform(transform)
+
+        return ti
+
+    def test_formatTransformationMatrix(self):
+        xfFile = self._writeFile('two_views.xf',
+                                 ["   0.9999998   0.0001234  -0.0005678   0.9999997"
+                                  "      12.345     -6.789\n",
+                                  "   1.0000000   0.0000000   0.0000000   1.0000000"
+                                  "       0.000      2.500\n"])
+
+        matrices = utils.formatTransformationMatrix(xfFile)
+
+        self.assertEqual(matrices.shape, (2, 3, 3))
+        self.assertEqual(matrices.dtype, np.float32)
+
+        expected = np.array([[0.9999998, 0.0001234, 12.345],
+                             [-0.0005678, 0.9999997, -6.789],
+                             [0.0, 0.0, 1.0]])
+        np.testing.assert_allclose(matrices[0], expected, atol=1e-6)
+
+        # A12 and A21 must not be transposed
+        self.assertAlmostEqual(matrices[0, 0, 1], 0.0001234, places=6)
+        self.assertAlmostEqual(matrices[0, 1, 0], -0.0005678, places=6)
+
+        np.testing.assert_array_equal(matrices[:, 2, :2], 0.0)
+        np.testing.assert_array_equal(matrices[:, 2, 2], 1.0)
+        self.assertAlmostEqual(matrices[1, 1, 2], 2.5, places=6)
+
+    def test_formatTransformationMatrixSingleView(self):
+        xfFile = self._writeFile('single_view.xf',
+                                 ["   0.5   0.1   0.2   0.4   1.0   2.0\n"])
+
+        matrices = utils.formatTransformationMatrix(xfFile)
+
+        self.assertEqual(matrices.shape, (1, 3, 3))
+        np.testing.assert_allclose(matrices[0],
+                                   [[0.5, 0.1, 1.0],
+                                    [0.2, 0.4, 2.0],
+                                    [0.0, 0.0, 1.0]])
+
+    def test_hasIdentityTransforms(self):
+        identity = np.identity(3)
+        shifted = np.identity(3)
+        shifted[0, 2] = 3.0
+
+        self.assertTrue(utils.hasIdentityTransforms([self._tiltImage(identity),
+                                                     self._tiltImage(identity)]))
+        self.assertFalse(utils.hasIdentityTransforms([self._tiltImage(identity),
+                                                      self._tiltImage(shifted)]))
+        self.assertFalse(utils.hasIdentityTransforms([TiltImage()]))
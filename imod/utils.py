@@ -88,27 +88,21 @@ def formatTransformFileFromTransformList(transformMatrixList, transformFilePath)
 def formatTransformationMatrix(matrixFile):
     """ This method takes an IMOD-based transformation matrix file path and
     returns a 3D matrix containing the transformation matrices for
-    each tilt-image belonging to the tilt-series. """
-
-    with open(matrixFile, "r") as matrix:
-        lines = matrix.readlines()
-
-    numberLines = len(lines)
-    frameMatrix = np.empty([3, 3, numberLines])
-
-    i = 0
-    for line in lines:
-        values = line.split()
-        frameMatrix[0, 0, i] = float(values[0])
-        frameMatrix[1, 0, i] = float(values[2])
-        frameMatrix[0, 1, i] = float(values[1])
-        frameMatrix[1, 1, i] = float(values[3])
-        frameMatrix[0, 2, i] = float(values[4])
-        frameMatrix[1, 2, i] = float(values[5])
-        frameMatrix[2, 0, i] = 0.0
-        frameMatrix[2, 1, i] = 0.0
-        frameMatrix[2, 2, i] = 1.0
-        i += 1
+    each tilt-image belonging to the tilt-series. The matrix of the
+    i-th tilt-image is frameMatrix[i]. Values are returned as float32,
+    enough for the precision IMOD writes them with. """
+
+    # Each line holds A11 A12 A21 A22 DX DY
+    values = np.loadtxt(matrixFile, dtype=np.float32, usecols=range(6), ndmin=2)
+
+    frameMatrix = np.zeros((values.shape[0], 3, 3), dtype=np.float32)
+    frameMatrix[:, 0, 0] = values[:, 0]
+    frameMatrix[:, 0, 1] = values[:, 1]
+    frameMatrix[:, 1, 0] = values[:, 2]
+    frameMatrix[:, 1, 1] = values[:, 3]
+    frameMatrix[:, 0, 2] = values[:, 4]
+    frameMatrix[:, 1, 2] = values[:, 5]
+    frameMatrix[:, 2, 2] = 1.0
 
     return frameMatrix
 
@@ -975,6 +969,20 @@ def calculateRotationAngleFromTM(ts):
     return avgRotationAngle
 
 
+def hasIdentityTransforms(ts):
+    """ This method checks if every tilt-image of the tilt-series has an
+    identity transformation matrix associated, so applying it would not
+    modify the images. """
+    identity = np.identity(3)
+
+    for ti in ts:
+        if not ti.hasTransform() or \
+                not np.allclose(ti.getTransform().getMatrix(), identity):
+            return False
+
+    return True
+
+
 def generateDoseFileFromDoseTS(ts, doseFileOutputPath):
     """ This method generates a file containing the dose information
     of a tilt series in the specified location from the accumulated